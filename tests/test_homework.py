@@ -1,11 +1,11 @@
 # flake8: noqa: E501
 """Autograding script."""
 
-import gzip
 import json
 import os
 import pickle
 
+import joblib  # type: ignore
 import pandas as pd  # type: ignore
 
 # ------------------------------------------------------------------------------
@@ -57,8 +57,7 @@ METRICS = [
 def _load_model():
     """Generic test to load a model"""
     assert os.path.exists(MODEL_FILENAME)
-    with gzip.open(MODEL_FILENAME, "rb") as file:
-        model = pickle.load(file)
+    model = joblib.load(MODEL_FILENAME)
     assert model is not None
     return model
 